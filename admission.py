@@ -0,0 +1,149 @@
+"""
+Nexa Admission Control
+Per-backend rate limits and concurrency caps with queue-time deadlines,
+so upstream pressure is shed instead of queued
+"""
+
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # tokens per second, 0 or less means unlimited
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Take a token if one is available within max_wait seconds.
+        Returns how long to wait before using it, or None if the caller should shed.
+        """
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            wait = (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self.tokens -= 1  # Reserve a future token; later callers queue behind it
+            return wait
+
+
+class BackendGate:
+    def __init__(self, name, rate, burst, max_concurrency):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "shed_concurrency": 0, "shed_rate": 0, "shed_timeout": 0, "in_flight": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def admit(self, deadline):
+        """Wait for a concurrency slot and a rate token, but never past the deadline"""
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._count("shed_concurrency")
+            return False
+
+        wait = self.bucket.reserve(max(deadline - time.monotonic(), 0))
+        if wait is None:
+            self._slots.release()
+            self._count("shed_rate")
+            return False
+        if wait:
+            time.sleep(wait)
+
+        with self._lock:
+            self.stats["admitted"] += 1
+            self.stats["in_flight"] += 1
+        return True
+
+    def release(self):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["rate"] = self.bucket.rate
+        return stats
+
+
+class AdmissionController:
+    def __init__(self, queue_budget=0.5, limits=None, default_limits=(0, 1, 4)):
+        self.queue_budget = queue_budget  # Longest a request may wait for upstream admission overall
+        self.limits = limits or {}  # backend prefix -> (rate, burst, max_concurrency)
+        self.default_limits = default_limits
+        self._gates = {}
+        self._lock = threading.Lock()
+        self.degraded = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build limits from NEXA_<BACKEND>_RATE / _BURST / _CONCURRENCY environment variables"""
+        def limits(prefix, rate, burst, concurrency):
+            return (float(os.getenv(f"NEXA_{prefix}_RATE", rate)),
+                    int(os.getenv(f"NEXA_{prefix}_BURST", burst)),
+                    int(os.getenv(f"NEXA_{prefix}_CONCURRENCY", concurrency)))
+        return cls(
+            queue_budget=float(os.getenv("NEXA_QUEUE_BUDGET_MS", 500)) / 1000,
+            limits={
+                "gemini": limits("GEMINI", 5, 10, 8),
+                "hf": limits("HF", 2, 4, 2),  # Applied to each Hugging Face model separately
+            },
+        )
+
+    def gate(self, backend):
+        """Get the gate for a backend, e.g. "gemini" or "hf:<model id>" """
+        gate = self._gates.get(backend)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.get(backend)
+                if gate is None:
+                    rate, burst, concurrency = self.limits.get(backend.split(":", 1)[0], self.default_limits)
+                    gate = self._gates[backend] = BackendGate(backend, rate, burst, concurrency)
+        return gate
+
+    def deadline(self):
+        """Queue-time deadline for one request, shared by every backend it tries"""
+        return time.monotonic() + self.queue_budget
+
+    def admit(self, backend, deadline):
+        return self.gate(backend).admit(deadline)
+
+    def release(self, backend):
+        self.gate(backend).release()
+
+    def record_shed(self, backend):
+        """Count a call that was admitted earlier but gave up waiting on its result"""
+        self.gate(backend)._count("shed_timeout")
+
+    def record_degraded(self):
+        with self._lock:
+            self.degraded += 1
+
+    def get_stats(self):
+        """Get per-backend admission counters plus the number of degraded answers"""
+        with self._lock:
+            gates = dict(self._gates)
+            degraded = self.degraded
+        backends = {name: gate.get_stats() for name, gate in gates.items()}
+        return {
+            "queue_budget_ms": self.queue_budget * 1000,
+            "degraded": degraded,
+            "shed": sum(s["shed_concurrency"] + s["shed_rate"] + s["shed_timeout"] for s in backends.values()),
+            "backends": backends,
+        }
@@ -1,6 +1,5 @@
 import os
-import requests
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
 import datetime
 import subprocess
@@ -10,16 +9,53 @@ import pyautogui
 import time
 import json
 import random
+import atexit
+import uuid
+import concurrent.futures
+import hmac
+import socket
 from nexa_ai_model import NexaAI
+from nexa_tenants import NexaTenantStore
+from speculation import SpeculativeRouter
+from admission import AdmissionController
+from upstream_client import UpstreamClient
 import google.generativeai as genai
 
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 load_dotenv()
 
 app = Flask(__name__)
 
+# Persistent voice channel (optional); /api/command remains the fallback
+if Sock:
+    sock = Sock(app)
+else:
+    sock = None
+    print("⚠️ flask-sock not installed. WebSocket voice channel disabled.")
+
 # Initialize custom Nexa AI model
 nexa_ai = NexaAI()
 
+# Pick up retrained model files without a restart (0 disables the file watch)
+MODEL_WATCH_INTERVAL = float(os.getenv("NEXA_MODEL_WATCH_INTERVAL", 0))
+if MODEL_WATCH_INTERVAL > 0:
+    nexa_ai.watch(MODEL_WATCH_INTERVAL)
+ADMIN_TOKEN = os.getenv("NEXA_ADMIN_TOKEN")
+
+# Per-user models for requests that carry a user id; the global model can be
+# shared underneath them so common knowledge isn't duplicated per tenant
+nexa_tenants = NexaTenantStore(
+    tenant_dir=os.getenv("NEXA_TENANT_DIR", "nexa_tenants"),
+    max_resident=int(os.getenv("NEXA_MAX_RESIDENT_TENANTS", 32)),
+    base=nexa_ai if os.getenv("NEXA_TENANT_SHARED_BASE", "true").lower() not in ("0", "false", "no") else None,
+)
+nexa_tenants.start_flusher(float(os.getenv("NEXA_TENANT_FLUSH_INTERVAL", 30)))
+atexit.register(nexa_tenants.flush)
+
 # --- Configuration ---
 # IMPORTANT: Set your API keys in the .env file
 HF_API_KEY = os.getenv("HF_API_KEY")
@@ -41,6 +77,25 @@ else:
     headers = None
     print("⚠️ HF_API_KEY not found.")
 
+# Shared keep-alive client used by every backend in the MODELS chain
+upstream = UpstreamClient.from_env(headers=headers)
+
+# Rate limits and concurrency caps per backend; over budget we answer locally instead of queuing
+admission = AdmissionController.from_env()
+DEGRADED_MIN_SCORE = float(os.getenv("NEXA_DEGRADED_MIN_SCORE", 1))
+
+# Speculative pre-routing from interim transcripts (clients opt in per session)
+if os.getenv("NEXA_SPECULATION", "true").lower() not in ("0", "false", "no"):
+    speculator = SpeculativeRouter(
+        llm_call=(lambda text: speculative_gemini(text)) if gemini_model else None,
+        is_command=lambda text: looks_like_system_command(text) or "time" in text.lower(),
+        max_workers=int(os.getenv("NEXA_SPECULATION_WORKERS", 2)),
+        stable_hits=int(os.getenv("NEXA_SPECULATION_STABLE_HITS", 2)),
+        min_words=int(os.getenv("NEXA_SPECULATION_MIN_WORDS", 3)),
+    )
+else:
+    speculator = None
+
 # List of models to try in order of preference
 MODELS = [
     "facebook/blenderbot-400M-distill",
@@ -299,6 +354,15 @@ def process_system_command(text):
 
     return None
 
+def looks_like_system_command(text):
+    """
+    Side-effect free check for whether process_system_command would act on this text.
+    Used to keep speculative work away from commands.
+    """
+    text_lower = text.lower()
+    triggers = ['type', 'write', 'search', 'google', 'play', 'youtube', 'open', 'find file']
+    return any(trigger in text_lower for trigger in triggers)
+
 def local_chat_response(text):
     """
     Provides intelligent responses when the internet/API is down.
@@ -365,62 +429,179 @@ def local_chat_response(text):
 
 def query_model(model_id, payload):
     url = f"https://api-inference.huggingface.co/models/{model_id}"
-    response = requests.post(url, headers=headers, json=payload, timeout=10, verify=False)
+    # Inference calls have no side effects, so read timeouts are safe to retry too
+    response = upstream.post(url, json=payload, idempotent=True)
     return response
 
-def query_huggingface(payload):
+def get_nexa_model(user_id=None):
+    """Return the caller's tenant model, or the global model for anonymous requests"""
+    if user_id:
+        return nexa_tenants.get(str(user_id))
+    return nexa_ai
+
+def request_user_id(data=None):
+    """Read the tenant id from the JSON body, header or query string"""
+    if data and data.get('user_id'):
+        return data['user_id']
+    return request.headers.get('X-Nexa-User') or request.args.get('user_id')
+
+def call_gemini(user_input, on_partial=None):
+    """Ask Gemini for a reply, streaming chunks to on_partial if given"""
+    # Create a conversational prompt
+    prompt = f"""You are Nexa, an advanced AI voice assistant. You are helpful, friendly, and concise.
+            
+User: {user_input}
+
+Respond naturally and helpfully. Keep responses concise (2-3 sentences max) since this is a voice conversation."""
+    
+    if on_partial:
+        chunks = []
+        for chunk in gemini_model.generate_content(prompt, stream=True):
+            chunks.append(chunk.text)
+            on_partial(chunk.text)
+        return "".join(chunks)
+    response = gemini_model.generate_content(prompt)
+    return response.text
+
+def speculative_gemini(user_input):
+    """Background Gemini call for the SpeculativeRouter; skipped rather than queued when saturated"""
+    if not admission.admit("gemini", time.monotonic()):
+        return None
+    try:
+        return call_gemini(user_input)
+    finally:
+        admission.release("gemini")
+
+def settle_speculative_llm(speculation, used=False):
+    """Tell the router whether the claimed speculative LLM call answered this turn"""
+    future = speculation.pop("llm", None)
+    if speculator and future is not None:
+        speculator.settle(future, used)
+
+def await_speculative_llm(future, deadline):
+    """
+    Wait for a claimed speculative Gemini call. One still queued behind busy
+    speculation workers gets no longer than the queue-time deadline and is
+    cancelled; one already running gets the usual read timeout.
+    """
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except concurrent.futures.TimeoutError:
+        if future.cancel():
+            raise
+    return future.result(timeout=upstream.read_timeout)
+
+def degraded_response(user_input, nexa):
+    """Answer locally on purpose when upstream is saturated"""
+    print("⚠️ Upstream saturated. Degrading to local answer.")
+    admission.record_degraded()
+    degraded_reply = nexa.generate_response(user_input, min_score=DEGRADED_MIN_SCORE)
+    # Not trained on: a low-confidence guess shouldn't reinforce itself
+    return [{"generated_text": degraded_reply or local_chat_response(user_input), "source": "degraded"}]
+
+def query_huggingface(payload, nexa=None, on_partial=None, speculation=None):
+    """
+    Route one utterance through the model chain. Each result is tagged with the
+    "source" that produced it. If on_partial is given, Gemini streams and the
+    callback receives each text chunk as it arrives. speculation is the work
+    claimed from the SpeculativeRouter for this exact transcript, if any.
+    """
     user_input = payload.get("inputs", "")
+    nexa = nexa or nexa_ai
+    speculation = speculation or {}
     
     # 1. Try Custom Nexa AI Model FIRST (trained on your conversations)
-    custom_response = nexa_ai.generate_response(user_input)
+    if speculation.get("nexa"):
+        custom_response = speculation["nexa"][0]
+    else:
+        custom_response = nexa.generate_response(user_input)
     if custom_response:
         print(f"✅ Using custom Nexa AI model response")
-        nexa_ai.train(user_input, custom_response)
-        return [{"generated_text": f"{custom_response} [Nexa AI]"}]
+        settle_speculative_llm(speculation)
+        nexa.train(user_input, custom_response)
+        return [{"generated_text": f"{custom_response} [Nexa AI]", "source": "nexa"}]
     
     # 2. Check for System Commands
     system_response = process_system_command(user_input)
     if system_response:
-        nexa_ai.train(user_input, system_response)
-        return [{"generated_text": system_response}]
+        settle_speculative_llm(speculation)
+        nexa.train(user_input, system_response)
+        return [{"generated_text": system_response, "source": "command"}]
 
     # 3. Local Fallbacks for Conversation (High Priority)
     text = user_input.lower()
     if "time" in text:
         now = datetime.datetime.now().strftime("%I:%M %p")
         response = f"The current time is {now}."
-        nexa_ai.train(user_input, response)
-        return [{"generated_text": response}]
+        settle_speculative_llm(speculation)
+        nexa.train(user_input, response)
+        return [{"generated_text": response, "source": "local"}]
+
+    # Upstream calls below share one queue-time budget; a backend that can't
+    # admit us within it is skipped (shed) rather than waited on
+    deadline = admission.deadline()
+    shed = False
 
     # 4. Try Google Gemini AI (PRIMARY AI MODEL)
-    if gemini_model:
+    # A claimed speculative call already is this turn's Gemini attempt: if it
+    # times out or fails, a second call for the same utterance is never made
+    speculative_response = None
+    speculative_attempted = False
+    if gemini_model and speculation.get("llm"):
         try:
-            print(f"🤖 Using Google Gemini AI...")
-            
-            # Create a conversational prompt
-            prompt = f"""You are Nexa, an advanced AI voice assistant. You are helpful, friendly, and concise.
-            
-User: {user_input}
-
-Respond naturally and helpfully. Keep responses concise (2-3 sentences max) since this is a voice conversation."""
-            
-            response = gemini_model.generate_content(prompt)
-            ai_response = response.text
+            speculative_response = await_speculative_llm(speculation["llm"], deadline)
+            # None means the speculation itself was shed, so nothing was attempted yet
+            speculative_attempted = speculative_response is not None
+        except concurrent.futures.TimeoutError:
+            print("⚠️ Speculative Gemini call timed out. Shedding, trying fallbacks.")
+            admission.record_shed("gemini")
+            speculative_attempted = True
+            shed = True
+        except Exception as e:
+            print(f"❌ Speculative Gemini error: {e}")
+            speculative_attempted = True
+
+    # A speculative call was admitted when it started; a fresh one is admitted now
+    gemini_admitted = False
+    if gemini_model and not speculative_attempted:
+        gemini_admitted = admission.admit("gemini", deadline)
+        shed = shed or not gemini_admitted
+    elif speculative_response is not None:
+        gemini_admitted = True
+
+    if gemini_admitted:
+        try:
+            if speculative_response is not None:
+                print(f"🤖 Using speculative Google Gemini AI call...")
+                ai_response = speculative_response
+            else:
+                print(f"🤖 Using Google Gemini AI...")
+                ai_response = call_gemini(user_input, on_partial)
             
             print(f"✅ Gemini response: {ai_response[:100]}...")
             
+            settle_speculative_llm(speculation, used=speculative_response is not None)
             # Train custom model on Gemini's responses
-            nexa_ai.train(user_input, ai_response)
+            nexa.train(user_input, ai_response)
             
-            return [{"generated_text": ai_response}]
+            return [{"generated_text": ai_response, "source": "gemini"}]
             
         except Exception as e:
             print(f"❌ Gemini error: {e}")
             # Continue to fallback models
+        finally:
+            if speculative_response is None:
+                admission.release("gemini")
+
+    settle_speculative_llm(speculation)
 
     # 5. Call External Hugging Face Models (Fallback)
     if headers:
         for model in MODELS:
+            if not admission.admit(f"hf:{model}", deadline):
+                print(f"Model {model} is saturated, skipping...")
+                shed = True
+                continue
             try:
                 print(f"Trying Hugging Face model: {model}...")
                 response = query_model(model, payload)
@@ -429,7 +610,8 @@ Respond naturally and helpfully. Keep responses concise (2-3 sentences max) sinc
                     result = response.json()
                     if isinstance(result, list) and len(result) > 0:
                         ai_response = result[0].get('generated_text', '')
-                        nexa_ai.train(user_input, ai_response)
+                        nexa.train(user_input, ai_response)
+                        result[0]["source"] = "huggingface"
                     return result
                 elif response.status_code in [503, 410, 404, 500]:
                     print(f"Model {model} failed ({response.status_code}), trying next...")
@@ -441,12 +623,18 @@ Respond naturally and helpfully. Keep responses concise (2-3 sentences max) sinc
             except Exception as e:
                 print(f"Exception with {model}: {e}")
                 continue
+            finally:
+                admission.release(f"hf:{model}")
+
+    # 6. Load Shedding: upstream was over budget, so answer locally on purpose
+    if shed:
+        return degraded_response(user_input, nexa)
 
-    # 6. Ultimate Fallback: OFFLINE MODE with Learning
+    # 7. Ultimate Fallback: OFFLINE MODE with Learning
     print("All online models failed. Switching to Local Offline Mode.")
     local_reply = local_chat_response(user_input)
-    nexa_ai.train(user_input, local_reply)
-    return [{"generated_text": local_reply}]
+    nexa.train(user_input, local_reply)
+    return [{"generated_text": local_reply, "source": "offline"}]
 
 @app.route('/')
 def index():
@@ -461,9 +649,27 @@ def command():
         return jsonify({'reply': "I didn't hear anything."})
 
     # Get response from Logic (System or AI)
-    response_data = query_huggingface({"inputs": user_input})
-    
-    # Parse Hugging Face response structure
+    nexa = get_nexa_model(request_user_id(data))
+    speculation = speculator.claim(str(data['session']), user_input, nexa) if speculator and data.get('session') else None
+    response_data = query_huggingface({"inputs": user_input}, nexa, speculation=speculation)
+    return jsonify({'reply': extract_reply(response_data)})
+
+@app.route('/api/pre-route', methods=['POST'])
+def pre_route():
+    """Warm routing for an interim transcript; the matching /api/command reuses the work"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    text = str(data.get('text') or '')
+    session_key = str(data.get('session') or '')
+    if not speculator or not session_key or not text:
+        return jsonify({'speculating': False})
+
+    nexa = get_nexa_model(request_user_id(data))
+    return jsonify(speculator.observe(session_key, nexa, text))
+
+def extract_reply(response_data):
+    """Parse the Hugging Face style response structure into reply text"""
     if isinstance(response_data, list) and len(response_data) > 0:
         generated_text = response_data[0].get('generated_text', '')
         if "Assistant:" in generated_text:
@@ -479,26 +685,205 @@ def command():
     else:
         reply = "I'm not sure how to respond to that."
 
-    return jsonify({'reply': reply})
+    return reply
+
+if sock:
+    @sock.route('/ws/voice')
+    def voice_channel(ws):
+        """
+        One persistent connection per client carrying utterances, partial replies
+        and action events. Session state lives for the lifetime of the socket.
+
+        Client -> server: hello {user_id}, interim {text}, utterance {id, text}, ping
+        Server -> client: ready, ack, partial, action, reply, error, pong
+        """
+        session = {
+            "id": uuid.uuid4().hex,
+            "user_id": request.args.get('user_id'),
+            "turns": 0,
+            "connected_at": datetime.datetime.now().isoformat()
+        }
+        # The tenant model is looked up per turn, never cached on the session:
+        # the tenant store may evict it while the socket stays open
+        try:
+            # Frames are small and latency-bound; don't let Nagle hold them back
+            ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError):
+            pass
+
+        def send(message_type, **fields):
+            ws.send(json.dumps({"type": message_type, **fields}, ensure_ascii=False))
+
+        send("ready", session=session["id"])
+        while True:
+            raw = ws.receive()
+            if raw is None:
+                break
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                send("error", error="Invalid JSON")
+                continue
+            if not isinstance(message, dict):
+                send("error", error="Messages must be JSON objects")
+                continue
+
+            message_type = message.get("type")
+            if message_type == "ping":
+                send("pong")
+            elif message_type == "hello":
+                if message.get("user_id"):
+                    session["user_id"] = str(message["user_id"])
+                send("ready", session=session["id"])
+            elif message_type == "interim":
+                # Speculation only; nothing is sent back
+                if speculator and message.get("text"):
+                    speculator.observe(session["id"], get_nexa_model(session["user_id"]), str(message["text"]))
+            elif message_type == "utterance":
+                turn_id = message.get("id")
+                user_input = str(message.get("text") or "").strip()
+                if not user_input:
+                    send("reply", id=turn_id, text="I didn't hear anything.", source="empty")
+                    continue
+
+                send("ack", id=turn_id)
+                session["turns"] += 1
+                try:
+                    nexa = get_nexa_model(session["user_id"])
+                    speculation = speculator.claim(session["id"], user_input, nexa) if speculator else None
+                    response_data = query_huggingface(
+                        {"inputs": user_input}, nexa,
+                        on_partial=lambda chunk: send("partial", id=turn_id, text=chunk),
+                        speculation=speculation
+                    )
+                except Exception as e:
+                    # Keep the socket alive and settle the client's pending turn
+                    print(f"❌ Voice channel turn failed: {e}")
+                    send("error", id=turn_id, error="Turn failed")
+                    send("reply", id=turn_id, text="Sorry, something went wrong handling that.", source="error")
+                    continue
+                reply = extract_reply(response_data)
+                source = response_data[0].get("source") if isinstance(response_data, list) and response_data else None
+                if source == "command":
+                    send("action", id=turn_id, text=reply)
+                send("reply", id=turn_id, text=reply, source=source)
+            else:
+                send("error", error=f"Unknown message type: {message_type}")
 
 
 
 @app.route('/api/nexa-model-stats', methods=['GET'])
 def nexa_model_stats():
     """Get custom Nexa AI model statistics"""
-    stats = nexa_ai.get_stats()
+    stats = get_nexa_model(request_user_id()).get_stats()
     return jsonify({
         'model_name': 'Nexa Custom AI',
         'status': 'active',
         'statistics': stats,
+        'tenants': nexa_tenants.get_stats(),
         'description': 'Self-trained model that learns from your conversations'
     })
 
 @app.route('/api/nexa-knowledge', methods=['GET'])
 def nexa_knowledge():
-    """Export Nexa AI's learned knowledge"""
-    knowledge = nexa_ai.export_knowledge()
-    return jsonify(knowledge)
+    """
+    Stream Nexa AI's learned knowledge as NDJSON, one page at a time.
+    Query params: cursor, limit, intent, prefix. The last line carries next_cursor.
+    """
+    nexa = get_nexa_model(request_user_id())
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+    intent = request.args.get('intent') or None
+    prefix = (request.args.get('prefix') or '').lower() or None
+
+    def generate():
+        yield json.dumps({
+            "type": "meta",
+            "intents": list(nexa.model["intents"].keys()),
+            "stats": nexa.get_stats(),
+            "conversation_examples": nexa.model.get("conversations", [])[-5:] if cursor == 0 else []
+        }, ensure_ascii=False) + "\n"
+
+        emitted = 0
+        next_cursor = None
+        # Ask for one extra match: if it exists, the next page starts at it
+        for position, keyword, entry in nexa.iter_top_patterns(cursor, limit + 1, intent, prefix):
+            if emitted >= limit:
+                next_cursor = position
+                break
+            yield json.dumps({
+                "type": "pattern",
+                "keyword": keyword,
+                "response": entry["response"],
+                "usage_count": entry["count"],
+                "intent": entry["context"]
+            }, ensure_ascii=False) + "\n"
+            emitted += 1
+
+        yield json.dumps({"type": "page", "count": emitted, "next_cursor": next_cursor}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def admin_allowed():
+    """Admin calls must carry NEXA_ADMIN_TOKEN; without one configured they are disabled"""
+    # No localhost exemption: behind a reverse proxy every request comes from 127.0.0.1
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+@app.route('/api/admin/model', methods=['GET'])
+def admin_model_version():
+    """Show the active and rollback model snapshots"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(nexa_ai.version_info())
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Load a model snapshot in the background and swap it in.
+    Optional JSON body: {"file": "<name in the model directory>", "wait": true}
+    """
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+
+    path = None
+    if data.get('file'):
+        # Only files next to the live model can be loaded
+        model_dir = os.path.dirname(os.path.abspath(nexa_ai.model_file))
+        path = os.path.join(model_dir, os.path.basename(data['file']))
+        if not os.path.exists(path):
+            return jsonify({'error': f"{data['file']} not found"}), 404
+
+    if data.get('wait'):
+        try:
+            version = nexa_ai.reload(path)
+        except Exception as e:
+            return jsonify({'error': f"Reload failed: {e}"}), 400
+        return jsonify({'status': 'reloaded', 'version': version})
+
+    nexa_ai.reload_async(path)
+    return jsonify({'status': 'reloading', 'current_version': nexa_ai.snapshot.version}), 202
+
+@app.route('/api/admin/rollback', methods=['POST'])
+def admin_rollback():
+    """Swap back to the snapshot active before the last reload"""
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    version = nexa_ai.rollback()
+    if version is None:
+        return jsonify({'error': 'No previous snapshot to roll back to'}), 409
+    return jsonify({'status': 'rolled_back', 'version': version})
+
+@app.route('/api/upstream-stats', methods=['GET'])
+def upstream_stats():
+    """Get shared upstream HTTP client, admission and speculation counters"""
+    stats = upstream.get_stats()
+    stats["admission"] = admission.get_stats()
+    if speculator:
+        stats["speculation"] = speculator.get_stats()
+    return jsonify(stats)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,87 @@
+"""
+Upstream Client Benchmark
+Compares one-off requests.post calls against the pooled UpstreamClient
+using a local stub server that mimics the Hugging Face inference API.
+
+Usage: python benchmark_upstream.py [calls] [stub_delay_ms]
+"""
+
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from upstream_client import UpstreamClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Required for keep-alive
+    disable_nagle_algorithm = True  # Avoid 40ms delayed-ACK stalls on reused sockets
+    delay = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.delay:
+            time.sleep(self.delay)
+        body = json.dumps([{"generated_text": "stub reply"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(delay):
+    StubHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed_calls(send, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = send()
+        response.json()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+    return statistics.mean(timings)
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+
+    server = start_stub(delay)
+    url = f"http://127.0.0.1:{server.server_port}/models/stub"
+    payload = {"inputs": "hello nexa"}
+
+    print(f"📊 {calls} calls against {url}\n")
+    plain = timed_calls(lambda: requests.post(url, json=payload, timeout=10), calls)
+    client = UpstreamClient()
+    pooled = timed_calls(lambda: client.post(url, json=payload, idempotent=True), calls)
+
+    plain_mean = report("requests.post", plain)
+    pooled_mean = report("UpstreamClient", pooled)
+    print(f"\n✅ Saved {plain_mean - pooled_mean:.3f} ms per call "
+          f"({(1 - pooled_mean / plain_mean) * 100:.1f}%), before any TLS handshake cost")
+    print(f"Client stats: {client.get_stats()}")
+
+    client.close()
+    server.shutdown()
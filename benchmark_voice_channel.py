@@ -0,0 +1,69 @@
+"""
+Voice Channel Load Test
+Compares per-turn round-trip time of POST /api/command against the
+persistent /ws/voice WebSocket on a running Nexa server.
+
+Usage: python benchmark_voice_channel.py [base_url] [turns] [clients]
+"""
+
+import json
+import statistics
+import sys
+import threading
+import time
+
+import requests
+import simple_websocket
+
+UTTERANCE = "thanks nexa"
+# Tenant models don't write to disk every turn, so the timing reflects transport overhead
+USER_ID = "loadtest"
+
+
+def post_turns(base_url, turns, timings):
+    session = requests.Session()  # Keep-alive, like a browser's fetch
+    for _ in range(turns):
+        start = time.perf_counter()
+        session.post(f"{base_url}/api/command", json={"command": UTTERANCE, "user_id": USER_ID}, timeout=30).json()
+        timings.append((time.perf_counter() - start) * 1000)
+    session.close()
+
+
+def websocket_turns(base_url, turns, timings):
+    ws = simple_websocket.Client(base_url.replace("http", "ws", 1) + f"/ws/voice?user_id={USER_ID}")
+    for turn_id in range(turns):
+        start = time.perf_counter()
+        ws.send(json.dumps({"type": "utterance", "id": turn_id, "text": UTTERANCE}))
+        while json.loads(ws.receive()).get("type") != "reply":  # skip ready/ack/partial
+            pass
+        timings.append((time.perf_counter() - start) * 1000)
+    ws.close()
+
+
+def run(label, worker, base_url, turns, clients):
+    timings = []
+    threads = [threading.Thread(target=worker, args=(base_url, turns, timings)) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<10} mean {statistics.mean(timings):8.3f} ms   p50 {statistics.median(timings):8.3f} ms   "
+          f"p95 {p95:8.3f} ms   {len(timings) / elapsed:7.1f} turns/s")
+    return statistics.mean(timings)
+
+
+if __name__ == "__main__":
+    base_url = sys.argv[1].rstrip("/") if len(sys.argv) > 1 else "http://127.0.0.1:5000"
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    print(f"📊 {clients} clients x {turns} turns against {base_url}\n")
+    post_mean = run("POST", post_turns, base_url, turns, clients)
+    ws_mean = run("WebSocket", websocket_turns, base_url, turns, clients)
+    print(f"\n✅ WebSocket saves {post_mean - ws_mean:.3f} ms per turn "
+          f"({(1 - ws_mean / post_mean) * 100:.1f}%)")
@@ -8,21 +8,81 @@ import os
 import re
 from collections import defaultdict
 import random
+import threading
+import time
 from datetime import datetime
+from itertools import islice
+
+REQUIRED_MODEL_KEYS = ("patterns", "intents", "vocabulary")
+
+class ModelSnapshot:
+    """One loaded version of the model plus the lookups derived from it"""
+    def __init__(self, model, version, source):
+        self.model = model
+        self.version = version
+        self.source = source
+        self.loaded_at = datetime.now().isoformat()
+        self.vocabulary_set = set(model["vocabulary"])
+        self.pattern_keys = list(model["patterns"].keys())  # stable order for export cursors
+        self.top_patterns = {}  # keyword -> its highest-count response entry
+        for keyword, responses in model["patterns"].items():
+            if responses:
+                self.top_patterns[keyword] = max(responses, key=lambda x: x["count"])
+        self.training_examples = sum(len(v) for v in model["intents"].values())
 
 class NexaAI:
-    def __init__(self, memory_file="nexa_memory.json", model_file="nexa_model.json"):
+    def __init__(self, memory_file="nexa_memory.json", model_file="nexa_model.json", base=None, autosave=True):
         self.memory_file = memory_file
         self.model_file = model_file
-        self.model = self.load_model()
+        self.base = base  # Optional shared NexaAI layered under this model (read-only)
+        self.autosave = autosave  # When False, the owner flushes dirty models itself
+        self.dirty = False
+        self._lock = threading.RLock()  # Serializes train/save against snapshot swaps
+        self.previous_snapshot = None  # Kept for rollback after a reload
+        self.snapshot = ModelSnapshot(self.load_model(), version=1, source=self.model_file)
+        self.latest_version = 1  # Never reused, even after a rollback
+        self.model_mtime = self.file_mtime()
+        self._watcher = None
+        self._replay = None  # Turns trained while a reload is loading, re-applied after the swap
+        self._unsaved = []  # Turns trained since the last save, re-applied if the file is reloaded first
         self.conversation_history = []  # Track current conversation
         self.max_history = 10  # Remember last 10 exchanges
         
-    def load_model(self):
+    # Readers go through the current snapshot, so a reload is a single pointer swap
+    @property
+    def model(self):
+        return self.snapshot.model
+    
+    @property
+    def vocabulary_set(self):
+        return self.snapshot.vocabulary_set
+    
+    @property
+    def pattern_keys(self):
+        return self.snapshot.pattern_keys
+    
+    @property
+    def top_patterns(self):
+        return self.snapshot.top_patterns
+    
+    @property
+    def training_examples(self):
+        return self.snapshot.training_examples
+    
+    @training_examples.setter
+    def training_examples(self, value):
+        self.snapshot.training_examples = value
+    
+    def load_model(self, path=None):
         """Load the trained model from file"""
-        if os.path.exists(self.model_file):
-            with open(self.model_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        path = path or self.model_file
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                model = json.load(f)
+            missing = [key for key in REQUIRED_MODEL_KEYS if key not in model]
+            if missing:
+                raise ValueError(f"{path} is missing {', '.join(missing)}")
+            return model
         return {
             "patterns": {},  # keyword -> list of responses
             "context": {},   # conversation context
@@ -32,10 +92,130 @@ class NexaAI:
             "conversations": []  # multi-turn conversations
         }
     
+    def file_mtime(self):
+        try:
+            return os.path.getmtime(self.model_file)
+        except OSError:
+            return None
+    
     def save_model(self):
-        """Save the trained model to file"""
-        with open(self.model_file, 'w', encoding='utf-8') as f:
-            json.dump(self.model, f, indent=2, ensure_ascii=False)
+        """Save the trained model to file, unless it was replaced on disk since we last read or wrote it"""
+        with self._lock:
+            mtime = self.file_mtime()
+            if mtime is not None and mtime != self.model_mtime:
+                # Load the new file (replaying unsaved turns) instead of overwriting it
+                print(f"⚠️ {self.model_file} changed on disk. Reloading instead of saving over it.")
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"❌ Nexa AI model reload failed: {e}")
+                return
+            self.dirty = False  # Cleared first so training during the dump marks it dirty again
+            # Write aside and swap in, so readers never see a half-written file
+            temp_file = f"{self.model_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.model, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.model_file)
+            self.model_mtime = self.file_mtime()  # Our own writes shouldn't trigger the watcher
+            self._unsaved = []
+    
+    def reload(self, path=None):
+        """
+        Load and index a model snapshot, then swap it in.
+        The expensive part runs without the lock, so generate_response and train
+        keep working on the current snapshot until the swap. Turns not yet saved,
+        including those trained in the meantime, are replayed onto the new snapshot,
+        and saving waits until then.
+        """
+        path = path or self.model_file
+        if not os.path.exists(path):
+            # load_model would fall back to an empty model and wipe the live one
+            raise FileNotFoundError(f"{path} does not exist")
+        
+        with self._lock:
+            if self._replay is not None:
+                raise RuntimeError("A reload is already in progress")
+            self._replay = list(self._unsaved)
+            mtime = self.file_mtime() if path == self.model_file else None
+        
+        try:
+            snapshot = ModelSnapshot(self.load_model(path), version=None, source=path)
+        except Exception:
+            with self._lock:
+                self._replay = None
+                if mtime is not None:
+                    # Don't retry a file that won't load; the next external write changes its mtime
+                    self.model_mtime = mtime
+                if self.dirty and self.autosave:
+                    self.save_model()
+            raise
+        
+        with self._lock:
+            self.latest_version += 1
+            snapshot.version = self.latest_version
+            self.previous_snapshot, self.snapshot = self.snapshot, snapshot
+            if mtime is not None:
+                self.model_mtime = mtime
+            for user_input, assistant_response, exchanges in self._replay:
+                self._learn(user_input, assistant_response, exchanges)
+            self._replay = None
+            if self.dirty and self.autosave:
+                self.save_model()
+        print(f"🔄 Nexa AI model v{snapshot.version} loaded from {path}")
+        return snapshot.version
+    
+    def reload_async(self, path=None):
+        """Reload in a background thread; failures keep the current snapshot"""
+        def run():
+            try:
+                self.reload(path)
+            except Exception as e:
+                print(f"❌ Nexa AI model reload failed: {e}")
+        thread = threading.Thread(target=run, name="nexa-model-reload", daemon=True)
+        thread.start()
+        return thread
+    
+    def rollback(self):
+        """Swap back to the snapshot that was active before the last reload"""
+        with self._lock:
+            if self.previous_snapshot is None:
+                return None
+            self.previous_snapshot, self.snapshot = self.snapshot, self.previous_snapshot
+            # Persist it, or a restart would bring back the rejected snapshot from disk
+            self.dirty = True
+            self._unsaved = []  # Those turns went into the rejected snapshot
+            if self.autosave:
+                self.save_model()
+            print(f"↩️ Nexa AI model rolled back to v{self.snapshot.version}")
+            return self.snapshot.version
+    
+    def version_info(self):
+        """Describe the active and rollback snapshots"""
+        current, previous = self.snapshot, self.previous_snapshot
+        info = {"version": current.version, "source": current.source, "loaded_at": current.loaded_at}
+        if previous is not None:
+            info["previous"] = {"version": previous.version, "source": previous.source, "loaded_at": previous.loaded_at}
+        return info
+    
+    def watch(self, interval):
+        """Poll the model file and reload it in the background when it changes on disk"""
+        if self._watcher is not None:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                # Compared under the lock so a save in progress can't look like an external change
+                with self._lock:
+                    mtime = self.file_mtime()
+                    changed = mtime is not None and mtime != self.model_mtime and self._replay is None
+                if changed:
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        # Likely a half-written file; reload retries on its next change
+                        print(f"❌ Nexa AI model reload failed: {e}")
+        self._watcher = threading.Thread(target=run, name="nexa-model-watch", daemon=True)
+        self._watcher.start()
     
     def tokenize(self, text):
         """Break text into words"""
@@ -98,49 +278,72 @@ class NexaAI:
     
     def train(self, user_input, assistant_response):
         """Train the model on a conversation pair"""
-        # Add to conversation history
-        self.conversation_history.append({
-            "user": user_input,
-            "assistant": assistant_response,
-            "timestamp": datetime.now().isoformat()
-        })
+        # Held so a snapshot swap never lands halfway through an update
+        with self._lock:
+            # Add to conversation history
+            self.conversation_history.append({
+                "user": user_input,
+                "assistant": assistant_response,
+                "timestamp": datetime.now().isoformat()
+            })
+        
+            # Keep only recent history
+            if len(self.conversation_history) > self.max_history:
+                self.conversation_history = self.conversation_history[-self.max_history:]
         
-        # Keep only recent history
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+            exchanges = self.conversation_history[-2:] if len(self.conversation_history) >= 2 else None
+            self._learn(user_input, assistant_response, exchanges)
+            self._unsaved.append((user_input, assistant_response, exchanges))
+            if self._replay is not None:
+                # A reload is loading a new snapshot; this turn is re-applied to it after the swap
+                self._replay.append((user_input, assistant_response, exchanges))
         
+            self.dirty = True
+            if self.autosave and self._replay is None:
+                self.save_model()
+    
+    def _learn(self, user_input, assistant_response, exchanges):
+        """Apply one conversation pair to the current snapshot (caller holds the lock)"""
         # Extract keywords
         keywords = self.extract_keywords(user_input)
         intent = self.classify_intent(user_input)
         
         # Add to vocabulary
         for word in keywords:
-            if word not in self.model["vocabulary"]:
+            if word not in self.vocabulary_set:
+                self.vocabulary_set.add(word)
                 self.model["vocabulary"].append(word)
         
         # Store pattern-response pairs
         for keyword in keywords:
             if keyword not in self.model["patterns"]:
                 self.model["patterns"][keyword] = []
-            
+                self.pattern_keys.append(keyword)
+        
             response_entry = {
                 "response": assistant_response,
                 "context": intent,
                 "count": 1,
                 "last_used": datetime.now().isoformat()
             }
-            
-            existing = False
+        
+            existing = None
             for entry in self.model["patterns"][keyword]:
                 if entry["response"] == assistant_response:
                     entry["count"] += 1
                     entry["last_used"] = datetime.now().isoformat()
-                    existing = True
+                    existing = entry
                     break
-            
+        
             if not existing:
                 self.model["patterns"][keyword].append(response_entry)
         
+            # Keep the per-keyword top response current instead of re-scanning on export
+            updated = existing or response_entry
+            top = self.top_patterns.get(keyword)
+            if top is None or updated["count"] > top["count"]:
+                self.top_patterns[keyword] = updated
+        
         # Store intent patterns
         if intent not in self.model["intents"]:
             self.model["intents"][intent] = []
@@ -150,27 +353,35 @@ class NexaAI:
             "response": assistant_response,
             "timestamp": datetime.now().isoformat()
         })
+        self.training_examples += 1
         
         # Store multi-turn conversations
-        if len(self.conversation_history) >= 2:
+        if exchanges:
             if "conversations" not in self.model:
                 self.model["conversations"] = []
             self.model["conversations"].append({
-                "exchanges": self.conversation_history[-2:],
+                "exchanges": exchanges,
                 "timestamp": datetime.now().isoformat()
             })
         
-        self.save_model()
+    def layers(self):
+        """Models consulted for lookups: this model first, then the shared base"""
+        if self.base is not None:
+            return [self.model, self.base.model]
+        return [self.model]
     
-    def generate_response(self, user_input):
-        """Generate a contextual response based on learned patterns and conversation history"""
+    def generate_response(self, user_input, min_score=None):
+        """
+        Generate a contextual response based on learned patterns and conversation history.
+        min_score overrides the confidence threshold (used to degrade under load).
+        """
         keywords = self.extract_keywords(user_input)
         intent = self.classify_intent(user_input)
         context = self.get_conversation_context()
         
         # IMPORTANT: Only respond if we have HIGH CONFIDENCE
         # This allows Gemini API to handle most questions
-        MIN_CONFIDENCE_SCORE = 10  # Require at least score of 10
+        MIN_CONFIDENCE_SCORE = 10 if min_score is None else min_score  # 10 normally, lower when degrading
         
         # Check if this is a follow-up question
         if self.is_follow_up_question(user_input) and context:
@@ -180,9 +391,10 @@ class NexaAI:
         # Find matching patterns with context awareness
         candidate_responses = []
         
+        layers = self.layers()
         for keyword in keywords:
-            if keyword in self.model["patterns"]:
-                for entry in self.model["patterns"][keyword]:
+            for model in layers:
+                for entry in model["patterns"].get(keyword, []):
                     score = entry["count"]
                     
                     # Boost score if intent matches
@@ -196,10 +408,10 @@ class NexaAI:
                     candidate_responses.append((entry["response"], score))
         
         # Check for similar multi-turn conversations
-        if len(self.conversation_history) > 0 and "conversations" in self.model:
+        if len(self.conversation_history) > 0:
             last_user_msg = self.conversation_history[-1].get("user", "") if self.conversation_history else ""
             
-            for conv in self.model["conversations"]:
+            for conv in (c for model in layers for c in model.get("conversations", [])):
                 if len(conv["exchanges"]) >= 2:
                     # Check if previous exchange is similar
                     prev_user = conv["exchanges"][0].get("user", "")
@@ -221,9 +433,14 @@ class NexaAI:
         # DON'T use intent-based responses for questions - let Gemini handle them
         # Only use for greetings, farewells, and gratitude
         if intent in ['greeting', 'farewell', 'gratitude']:
-            if intent in self.model["intents"] and self.model["intents"][intent]:
-                similar = random.choice(self.model["intents"][intent])
-                return similar["response"]
+            pools = [model["intents"][intent] for model in layers if model["intents"].get(intent)]
+            if pools:
+                # Pick uniformly across all layers without concatenating them
+                index = random.randrange(sum(len(pool) for pool in pools))
+                for pool in pools:
+                    if index < len(pool):
+                        return pool[index]["response"]
+                    index -= len(pool)
         
         # Return None to let Gemini API handle the question
         return None
@@ -247,34 +464,30 @@ class NexaAI:
             "vocabulary_size": len(self.model["vocabulary"]),
             "patterns_learned": len(self.model["patterns"]),
             "intents_known": len(self.model["intents"]),
-            "total_training_examples": sum(len(v) for v in self.model["intents"].values()),
+            "total_training_examples": self.training_examples,
             "conversations_stored": len(self.model.get("conversations", [])),
-            "current_conversation_length": len(self.conversation_history)
+            "current_conversation_length": len(self.conversation_history),
+            "model_version": self.snapshot.version
         }
     
-    def export_knowledge(self):
-        """Export learned knowledge in human-readable format"""
-        knowledge = {
-            "vocabulary": self.model["vocabulary"],
-            "top_patterns": {},
-            "intents": list(self.model["intents"].keys()),
-            "conversation_examples": []
-        }
-        
-        # Get top patterns
-        for keyword, responses in self.model["patterns"].items():
-            if responses:
-                top_response = max(responses, key=lambda x: x["count"])
-                knowledge["top_patterns"][keyword] = {
-                    "response": top_response["response"],
-                    "usage_count": top_response["count"]
-                }
-        
-        # Get conversation examples
-        if "conversations" in self.model:
-            knowledge["conversation_examples"] = self.model["conversations"][-5:]  # Last 5
-        
-        return knowledge
+    def iter_top_patterns(self, cursor=0, limit=None, intent=None, prefix=None):
+        """
+        Yield (position, keyword, top_entry) in training order starting at cursor,
+        optionally filtered by the entry's intent and a keyword prefix.
+        Positions are stable because keywords are only ever appended.
+        """
+        keys = self.pattern_keys
+        emitted = 0
+        for position, keyword in enumerate(islice(keys, cursor, None), start=cursor):
+            if prefix and not keyword.startswith(prefix):
+                continue
+            entry = self.top_patterns.get(keyword)
+            if entry is None or (intent and entry["context"] != intent):
+                continue
+            yield position, keyword, entry
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
     
     def reset_conversation(self):
         """Reset the current conversation context"""
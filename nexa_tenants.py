@@ -0,0 +1,139 @@
+"""
+Nexa Tenant Store
+Per-user Nexa AI models kept in a bounded LRU, layered over an optional shared base
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from nexa_ai_model import NexaAI
+
+
+class NexaTenantStore:
+    def __init__(self, tenant_dir="nexa_tenants", max_resident=32, base=None):
+        self.tenant_dir = tenant_dir
+        self.max_resident = max_resident
+        self.base = base  # Shared NexaAI consulted under every tenant's own patterns
+        self._resident = OrderedDict()  # user_id -> NexaAI, least recently used first
+        # Evicted models someone (an in-flight turn, a socket) still holds; reused
+        # instead of loading a second copy from disk while they are alive
+        self._evicted = weakref.WeakValueDictionary()
+        self._loading = {}  # user_id -> Event set once the thread reading its file is done
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "flushes": 0}
+        os.makedirs(self.tenant_dir, exist_ok=True)
+
+    def model_path(self, user_id):
+        """Map a user id to its model file, hashing ids that aren't filename-safe"""
+        if re.fullmatch(r'[A-Za-z0-9_-]{1,64}', user_id):
+            name = user_id
+        else:
+            name = hashlib.sha1(user_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.tenant_dir, f"{name}.json")
+
+    def get(self, user_id):
+        """Return the tenant's model, loading it lazily and evicting the coldest if full"""
+        while True:
+            with self._lock:
+                model = self._resident.get(user_id)
+                if model is not None:
+                    self._resident.move_to_end(user_id)
+                    self.stats["hits"] += 1
+                    return model
+
+                # Re-admit an evicted tenant that is still referenced somewhere
+                model = self._evicted.pop(user_id, None)
+                if model is not None:
+                    model.autosave = False
+                    evicted = self._admit(user_id, model)
+                    break
+
+                # Only one thread reads a tenant's file; the others wait for it, not for the store lock
+                loading = self._loading.get(user_id)
+                if loading is None:
+                    loading = self._loading[user_id] = threading.Event()
+                    model = None
+                    break
+            loading.wait()
+
+        if model is None:
+            try:
+                model = self._load(user_id)
+                with self._lock:
+                    self.stats["loads"] += 1
+                    evicted = self._admit(user_id, model)
+            finally:
+                with self._lock:
+                    del self._loading[user_id]
+                loading.set()
+
+        # Flush outside the lock so other tenants aren't blocked on disk I/O
+        for old_model in evicted:
+            self._flush(old_model)
+        return model
+
+    def _load(self, user_id):
+        """Read a tenant model from disk, moving a corrupt file aside and starting empty"""
+        path = self.model_path(user_id)
+        try:
+            return NexaAI(model_file=path, base=self.base, autosave=False)
+        except ValueError as e:
+            print(f"❌ Tenant model {path} is corrupt, starting fresh: {e}")
+            os.replace(path, f"{path}.corrupt")
+            return NexaAI(model_file=path, base=self.base, autosave=False)
+
+    def _admit(self, user_id, model):
+        """Make a model resident and return the ones evicted for it (caller holds the lock)"""
+        self._resident[user_id] = model
+        evicted = []
+        while len(self._resident) > self.max_resident:
+            old_id, old_model = self._resident.popitem(last=False)
+            # Nobody flushes a non-resident model, so any late train() saves itself
+            old_model.autosave = True
+            self._evicted[old_id] = old_model
+            evicted.append(old_model)
+            self.stats["evictions"] += 1
+        return evicted
+
+    def _flush(self, model):
+        if model.dirty:
+            model.save_model()
+            with self._lock:
+                self.stats["flushes"] += 1
+
+    def flush(self):
+        """Write every dirty resident tenant model to disk"""
+        with self._lock:
+            models = list(self._resident.values()) + list(self._evicted.values())
+        for model in models:
+            self._flush(model)
+
+    def start_flusher(self, interval):
+        """Flush dirty tenants every interval seconds so a crash loses at most that much training"""
+        if self._flusher is not None or interval <= 0:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"❌ Tenant flush failed: {e}")
+        self._flusher = threading.Thread(target=run, name="nexa-tenant-flush", daemon=True)
+        self._flusher.start()
+
+    def get_stats(self):
+        """Get tenant cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["resident"] = len(self._resident)
+            stats["max_resident"] = self.max_resident
+            stats["dirty"] = sum(1 for m in self._resident.values() if m.dirty)
+        stats["shared_base"] = self.base is not None
+        return stats
@@ -0,0 +1,148 @@
+"""
+Nexa Speculative Router
+Warms routing work from interim speech transcripts so the final turn can reuse it
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def normalize_transcript(text):
+    """Collapse case, punctuation and spacing so interim and final transcripts compare equal"""
+    return " ".join(re.sub(r'[^\w\s]', '', (text or '').lower()).split())
+
+
+class SpeculativeRouter:
+    def __init__(self, llm_call, is_command, max_workers=2, stable_hits=2, min_words=3,
+                 ttl=30, max_sessions=1000):
+        self.llm_call = llm_call  # text -> reply, run in the background for stable prefixes (None disables)
+        self.is_command = is_command  # text -> bool, commands are never sent to the LLM early
+        self.stable_hits = stable_hits  # identical interims in a row before speculating
+        self.min_words = min_words
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nexa-speculate")
+        self._sessions = OrderedDict()  # session key -> speculation state, least recently updated first
+        self._lock = threading.Lock()
+        self.stats = {
+            "interims": 0,
+            "nexa_warmed": 0,
+            "nexa_reused": 0,
+            "llm_started": 0,
+            "llm_reused": 0,
+            "llm_discarded": 0,
+        }
+
+    def _prune(self, now, incoming=None):
+        """Drop abandoned sessions from the front of the LRU, making room for incoming (caller holds the lock)"""
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            full = incoming not in self._sessions and len(self._sessions) >= self.max_sessions
+            if now - state["updated_at"] <= self.ttl and not full:
+                break
+            self._discard(self._sessions.pop(key))
+
+    def _discard(self, state):
+        future = state.get("future")
+        if future is not None:
+            # A call already in flight can't be interrupted; its result is simply dropped
+            future.cancel()
+            self.stats["llm_discarded"] += 1
+
+    @staticmethod
+    def _lookup_matches(state, nexa, text):
+        return (state["nexa_text"] == text and state["nexa_model"] is nexa
+                and state["nexa_snapshot"] is nexa.snapshot)
+
+    def observe(self, session_key, nexa, text):
+        """
+        Record an interim transcript: warm the custom model lookup and, once the
+        text has been stable for stable_hits interims, start the LLM call early.
+        """
+        normalized = normalize_transcript(text)
+        if not normalized:
+            return {"speculating": False}
+
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now, session_key)
+            self.stats["interims"] += 1
+            state = self._sessions.setdefault(session_key, {
+                "text": None, "hits": 0,
+                # The lookup is keyed on the raw text and the exact model it ran against:
+                # punctuation changes the intent, and tenants/snapshots change the patterns
+                "nexa_text": None, "nexa_model": None, "nexa_snapshot": None, "nexa_response": None,
+                "future": None, "future_text": None, "updated_at": now
+            })
+            state["updated_at"] = now
+            self._sessions.move_to_end(session_key)
+            if state["text"] == normalized:
+                state["hits"] += 1
+            else:
+                state["text"] = normalized
+                state["hits"] = 1
+            warm_nexa = not self._lookup_matches(state, nexa, text)
+
+        if warm_nexa:
+            # generate_response only reads the model, so it's safe to run ahead of the final
+            snapshot = nexa.snapshot
+            response = nexa.generate_response(text)
+            with self._lock:
+                state["nexa_text"] = text
+                state["nexa_model"] = nexa
+                state["nexa_snapshot"] = snapshot
+                state["nexa_response"] = response
+                self.stats["nexa_warmed"] += 1
+
+        with self._lock:
+            stable = state["hits"] >= self.stable_hits and state["text"] == normalized
+            if (self.llm_call is not None and stable and state["future_text"] != normalized and state["nexa_response"] is None
+                    and len(normalized.split()) >= self.min_words and not self.is_command(text)):
+                if state["future"] is not None:
+                    self._discard(state)
+                state["future"] = self.executor.submit(self.llm_call, text)
+                state["future_text"] = normalized
+                self.stats["llm_started"] += 1
+            return {"speculating": state["future_text"] == normalized}
+
+    def claim(self, session_key, final_text, nexa):
+        """
+        Hand over any work that matches the final transcript and discard the rest.
+        The lookup is only reused for the exact text against the same model snapshot.
+        Returns {"nexa": (response,) or None, "llm": future or None}.
+        """
+        normalized = normalize_transcript(final_text)
+        with self._lock:
+            state = self._sessions.pop(session_key, None)
+            if state is None:
+                return None
+
+            claimed = {"nexa": None, "llm": None}
+            if self._lookup_matches(state, nexa, final_text):
+                claimed["nexa"] = (state["nexa_response"],)
+                self.stats["nexa_reused"] += 1
+            if state["future"] is not None:
+                if state["future_text"] == normalized:
+                    claimed["llm"] = state["future"]  # Counted once settle() knows if it was used
+                else:
+                    self._discard(state)
+            return claimed
+
+    def settle(self, future, used):
+        """Record whether a claimed LLM call answered its turn; an unused one is cancelled"""
+        with self._lock:
+            if used:
+                self.stats["llm_reused"] += 1
+            else:
+                future.cancel()
+                self.stats["llm_discarded"] += 1
+
+    def get_stats(self):
+        """Get speculation counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["sessions"] = len(self._sessions)
+        return stats
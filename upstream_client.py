@@ -0,0 +1,166 @@
+"""
+Nexa Upstream Client
+Shared keep-alive HTTP client for calls to hosted model backends
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses where the upstream tells us the request was NOT processed,
+# so sending it again is always safe (rate limited / model still loading)
+RETRY_SAFE_STATUSES = {429, 503}
+# Statuses that are only worth retrying when the call itself is idempotent
+RETRY_IDEMPOTENT_STATUSES = {502, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class ResponseTooLarge(Exception):
+    """Raised when an upstream body exceeds the configured size limit"""
+
+
+class UpstreamClient:
+    def __init__(self, pool_connections=4, pool_maxsize=10, connect_timeout=3.05,
+                 read_timeout=10, max_retries=2, backoff_base=0.25, backoff_max=4.0,
+                 max_response_bytes=2 * 1024 * 1024, verify=True, headers=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_response_bytes = max_response_bytes
+
+        # One session shared by every backend; the adapter keeps a pool of
+        # keep-alive connections per host (pool_connections hosts, pool_maxsize each)
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers.update({"Connection": "keep-alive"})
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=0, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "oversized": 0,
+        }
+
+    @classmethod
+    def from_env(cls, headers=None):
+        """Build a client from UPSTREAM_* environment variables"""
+        return cls(
+            pool_connections=int(os.getenv("UPSTREAM_POOL_HOSTS", 4)),
+            pool_maxsize=int(os.getenv("UPSTREAM_POOL_SIZE", 10)),
+            connect_timeout=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05)),
+            read_timeout=float(os.getenv("UPSTREAM_READ_TIMEOUT", 10)),
+            max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", 2)),
+            backoff_base=float(os.getenv("UPSTREAM_BACKOFF_BASE", 0.25)),
+            backoff_max=float(os.getenv("UPSTREAM_BACKOFF_MAX", 4.0)),
+            max_response_bytes=int(os.getenv("UPSTREAM_MAX_RESPONSE_BYTES", 2 * 1024 * 1024)),
+            verify=os.getenv("UPSTREAM_VERIFY_SSL", "true").lower() not in ("0", "false", "no"),
+            headers=headers,
+        )
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def get_stats(self):
+        """Get a copy of the client counters"""
+        with self._lock:
+            return dict(self.stats)
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def _read_body(self, response):
+        """Read the body in chunks, refusing anything over max_response_bytes"""
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > self.max_response_bytes:
+            response.close()
+            raise ResponseTooLarge(f"{response.url} declared {declared} bytes")
+
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=16384):
+            body.extend(chunk)
+            if len(body) > self.max_response_bytes:
+                response.close()
+                raise ResponseTooLarge(f"{response.url} exceeded {self.max_response_bytes} bytes")
+
+        # Fully consumed, so the connection goes back to the pool for reuse
+        response._content = bytes(body)
+        response._content_consumed = True
+        return response
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """
+        Send a request through the shared pool.
+        Connect-phase failures and 429/503 are always retried; read timeouts and
+        502/504 are only retried when the call is idempotent.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        kwargs["stream"] = True
+
+        self._count("requests")
+        attempt = 0
+        while True:
+            self._count("attempts")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectTimeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.ReadTimeout) as e:
+                # ReadTimeout means the request reached the server, so only
+                # resend it when doing so can't have side effects
+                retryable = not isinstance(e, requests.exceptions.ReadTimeout) or idempotent
+                if retryable and attempt < self.max_retries:
+                    self._count("retries")
+                    time.sleep(self.backoff(attempt))
+                    attempt += 1
+                    continue
+                self._count("failures")
+                raise
+
+            status = response.status_code
+            retryable = status in RETRY_SAFE_STATUSES or (idempotent and status in RETRY_IDEMPOTENT_STATUSES)
+            if retryable and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                self._count("retries")
+                time.sleep(self.backoff(attempt, retry_after))
+                attempt += 1
+                continue
+
+            try:
+                return self._read_body(response)
+            except ResponseTooLarge:
+                self._count("oversized")
+                raise
+
+    def post(self, url, idempotent=None, **kwargs):
+        return self.request("POST", url, idempotent=idempotent, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()